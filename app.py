@@ -1,5 +1,5 @@
 from flask import Flask, render_template, make_response, request, redirect
-from flask import jsonify
+from flask import jsonify, Response, stream_with_context
 from flask import session as login_session
 from functools import wraps
 from sqlalchemy import create_engine
@@ -8,13 +8,33 @@ from database_setup import Base, User, Category, CategorySubItem
 import random
 import string
 import json
+import zlib
 import httplib2
 import requests
 from oauth2client.client import flow_from_clientsecrets
 from oauth2client.client import FlowExchangeError
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 app = Flask(__name__)
 
+# Set COMPRESS_ENABLED to False when a proxy in front of the app already
+# compresses responses. Responses smaller than COMPRESS_MIN_SIZE bytes are
+# sent uncompressed, and static files larger than COMPRESS_MAX_FILE_SIZE bytes
+# are sent as they are rather than read into memory.
+app.config.setdefault('COMPRESS_ENABLED', True)
+app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+app.config.setdefault('COMPRESS_MAX_FILE_SIZE', 1024 * 1024)
+app.config.setdefault('COMPRESS_MIMETYPES',
+                      ('text/html', 'text/css', 'application/json',
+                       'application/javascript', 'text/javascript'))
+app.config.setdefault('COMPRESS_LEVEL', 6)
+app.config.setdefault('COMPRESS_BR_LEVEL', 5)
+# Number of template events buffered into each streamed chunk
+app.config.setdefault('STREAM_BUFFER_SIZE', 20)
+
 CLIENT_ID = json.loads(
     open('client_secrets.json', 'r').read())['web']['client_id']
 
@@ -103,6 +123,112 @@ def generate_json_response(text, code):
     return response
 
 
+def stream_rendered_template(template_name, **context):
+    """Renders a template a chunk at a time as the response is sent instead of
+    building the whole page in memory first
+
+    Args:
+        template_name: name of the template to render
+        context: variables to pass to the template
+
+    Returns:
+        A streamed response object of the rendered template"""
+    app.update_template_context(context)
+    template = app.jinja_env.get_template(template_name)
+    stream = template.stream(context)
+    stream.enable_buffering(app.config['STREAM_BUFFER_SIZE'])
+    return Response(stream_with_context(stream), mimetype='text/html')
+
+
+def detach_from_session(instances):
+    """Removes ORM instances from the shared session so they can be read after
+    the view has returned without ever reaching the database
+
+    Args:
+        instances: iterable of ORM instances to detach"""
+    for instance in instances:
+        if instance in session:
+            session.expunge(instance)
+
+
+def get_compression_encoding():
+    """Determines the best content encoding accepted by the client
+
+    Returns:
+        'br' or 'gzip' if the client accepts it, None otherwise"""
+    supported = ['gzip']
+    if brotli is not None:
+        supported.insert(0, 'br')
+    return request.accept_encodings.best_match(supported)
+
+
+def compress_chunks(chunks, encoding):
+    """Compresses an iterable of byte strings, flushing after each chunk so
+    the client can start decoding before the last chunk is produced
+
+    Args:
+        chunks: iterable of byte strings to compress
+        encoding: 'br' or 'gzip'
+
+    Returns:
+        A generator of compressed byte strings"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(
+            quality=app.config['COMPRESS_BR_LEVEL'])
+        for chunk in chunks:
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(app.config['COMPRESS_LEVEL'],
+                                      zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            yield compressor.compress(chunk) + compressor.flush(
+                zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+
+
+@app.after_request
+def compress_response(response):
+    """Compresses text responses with gzip or brotli when the client accepts
+    it and COMPRESS_ENABLED is set. Buffered responses under COMPRESS_MIN_SIZE
+    are left as is, streamed responses are compressed chunk by chunk as they
+    are sent and static files up to COMPRESS_MAX_FILE_SIZE are read and
+    compressed whole"""
+    if not app.config['COMPRESS_ENABLED']:
+        return response
+    if (response.status_code != 200 or
+            response.mimetype not in app.config['COMPRESS_MIMETYPES'] or
+            'Content-Encoding' in response.headers):
+        return response
+    if response.direct_passthrough and (
+            response.content_length is None or
+            response.content_length > app.config['COMPRESS_MAX_FILE_SIZE']):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = get_compression_encoding()
+    if not encoding:
+        return response
+    is_file = response.direct_passthrough
+    if is_file:
+        # Read the file body so it can be compressed like any other response.
+        # The compressed body is a different representation of the file, so
+        # its ETag can only be weak
+        response.direct_passthrough = False
+        etag = response.get_etag()[0]
+        if etag:
+            response.set_etag(etag, weak=True)
+    if response.is_streamed and not is_file:
+        response.response = compress_chunks(response.iter_encoded(), encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < app.config['COMPRESS_MIN_SIZE']:
+            return response
+        response.set_data(b''.join(compress_chunks([data], encoding)))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
 @app.route('/')
 def MainPage():
     """The page handler for the first page"""
@@ -303,15 +429,19 @@ def CategoryPage(category_id):
         is_logged_in, name, picture = get_user_details()
         categories = get_all_categories()
         items = get_all_items_by_category(category.id)
-        return render_template('category.html',
-                               client_id=CLIENT_ID,
-                               picture=picture,
-                               name=name,
-                               forgery_token=generate_forgery_token(),
-                               logged_in=is_logged_in,
-                               curr_category=category,
-                               items=items,
-                               categories=categories)
+        # Stream the rendering so large categories are sent as they are
+        # rendered. Everything the template reads is loaded and detached up
+        # front so rendering never touches the shared session
+        detach_from_session([category] + categories + items)
+        return stream_rendered_template('category.html',
+                                        client_id=CLIENT_ID,
+                                        picture=picture,
+                                        name=name,
+                                        forgery_token=generate_forgery_token(),
+                                        logged_in=is_logged_in,
+                                        curr_category=category,
+                                        items=items,
+                                        categories=categories)
     return redirect('/', 302)
 
 
@@ -0,0 +1,140 @@
+"""Tests for the response compression in app.py
+
+Importing app needs the same setup as running it: a client_secrets.json in the
+working directory and the catalog database."""
+import unittest
+import zlib
+
+from flask import Response
+
+from app import app, brotli, compress_chunks, compress_response
+
+LARGE_BODY = b'<div class="panel">item</div>\n' * 200
+
+
+def gunzip(data):
+    """Decompresses a gzip framed byte string"""
+    return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+
+class CompressChunksTest(unittest.TestCase):
+    """Tests for compress_chunks"""
+
+    def test_gzip_round_trip(self):
+        chunks = [LARGE_BODY, b'middle', LARGE_BODY]
+        compressed = list(compress_chunks(chunks, 'gzip'))
+        self.assertEqual(gunzip(b''.join(compressed)), b''.join(chunks))
+
+    def test_gzip_flushes_every_chunk(self):
+        chunks = [b'first', b'second']
+        compressed = list(compress_chunks(chunks, 'gzip'))
+        # Everything written so far can be decoded before the stream ends
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.assertEqual(decompressor.decompress(compressed[0]), b'first')
+        self.assertEqual(decompressor.decompress(compressed[1]), b'second')
+
+    @unittest.skipIf(brotli is None, 'brotli is not installed')
+    def test_brotli_round_trip(self):
+        chunks = [LARGE_BODY, b'middle', LARGE_BODY]
+        compressed = b''.join(compress_chunks(chunks, 'br'))
+        self.assertEqual(brotli.decompress(compressed), b''.join(chunks))
+
+
+class CompressResponseTest(unittest.TestCase):
+    """Tests for the compress_response after_request hook"""
+
+    def setUp(self):
+        self.config = dict(app.config)
+
+    def tearDown(self):
+        app.config.update(self.config)
+
+    def compress(self, response, accept_encoding='gzip'):
+        """Runs compress_response on response for a request sending the passed
+        Accept-Encoding header"""
+        headers = {}
+        if accept_encoding:
+            headers['Accept-Encoding'] = accept_encoding
+        with app.test_request_context(headers=headers):
+            return compress_response(response)
+
+    def test_small_body_is_not_compressed(self):
+        response = self.compress(Response(b'<p>hi</p>', mimetype='text/html'))
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.get_data(), b'<p>hi</p>')
+        self.assertIn('Accept-Encoding', response.vary)
+
+    def test_large_body_is_compressed(self):
+        response = self.compress(Response(LARGE_BODY, mimetype='text/html'))
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.vary)
+        data = response.get_data()
+        self.assertEqual(response.content_length, len(data))
+        self.assertEqual(gunzip(data), LARGE_BODY)
+
+    def test_streamed_body_is_compressed(self):
+        chunks = [LARGE_BODY, LARGE_BODY]
+        response = self.compress(Response(iter(chunks),
+                                          mimetype='text/html'))
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', response.headers)
+        self.assertEqual(gunzip(b''.join(response.response)),
+                         b''.join(chunks))
+
+    def test_non_200_is_not_compressed(self):
+        response = self.compress(Response(LARGE_BODY, status=404,
+                                          mimetype='text/html'))
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.get_data(), LARGE_BODY)
+
+    def test_already_encoded_is_not_compressed(self):
+        response = Response(LARGE_BODY, mimetype='text/html')
+        response.headers['Content-Encoding'] = 'identity'
+        response = self.compress(response)
+        self.assertEqual(response.headers['Content-Encoding'], 'identity')
+        self.assertEqual(response.get_data(), LARGE_BODY)
+
+    def test_other_mimetypes_are_not_compressed(self):
+        response = self.compress(Response(LARGE_BODY, mimetype='image/png'))
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_no_accept_encoding_is_not_compressed(self):
+        response = self.compress(Response(LARGE_BODY, mimetype='text/html'),
+                                 accept_encoding=None)
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.get_data(), LARGE_BODY)
+
+    def test_disabled(self):
+        app.config['COMPRESS_ENABLED'] = False
+        response = self.compress(Response(LARGE_BODY, mimetype='text/html'))
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    @unittest.skipIf(brotli is None, 'brotli is not installed')
+    def test_brotli_is_preferred(self):
+        response = self.compress(Response(LARGE_BODY, mimetype='text/html'),
+                                 accept_encoding='gzip, br')
+        self.assertEqual(response.headers['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.get_data()), LARGE_BODY)
+
+    def test_static_file_is_compressed(self):
+        with app.test_request_context(headers={'Accept-Encoding': 'gzip'}):
+            response = app.send_static_file('production.css')
+            response = compress_response(response)
+            self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+            self.assertTrue(response.get_etag()[1])
+            with app.open_resource('static/production.css') as f:
+                self.assertEqual(gunzip(response.get_data()), f.read())
+            response.close()
+
+    def test_static_file_over_size_cap_is_not_compressed(self):
+        app.config['COMPRESS_MAX_FILE_SIZE'] = 1024
+        with app.test_request_context(headers={'Accept-Encoding': 'gzip'}):
+            response = app.send_static_file('production.css')
+            response = compress_response(response)
+            self.assertNotIn('Content-Encoding', response.headers)
+            self.assertTrue(response.direct_passthrough)
+            response.close()
+
+
+if __name__ == '__main__':
+    unittest.main()